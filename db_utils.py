@@ -1,78 +1,147 @@
-import os
-import firebase_admin
+import logging
+import time
+import firebase_client
 import llm_utils  # Make sure llm_utils is imported
-from firebase_admin import credentials, firestore, storage
-from datetime import datetime, timezone
-from typing import List, Dict, Any, Optional
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
 
 # --- Globals ---
 db = None
-bucket = None
+
+# Short-lived caches of challenge reads: date -> (expires_at, challenge) and
+# (expires_at, all challenges). Challenges rarely change after creation, and
+# writes made by this process update or invalidate them immediately. The
+# caches are per process, so other workers may serve a stale copy until it expires.
+CHALLENGE_CACHE_TTL_SECONDS = 300
+_challenge_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+_all_challenges_cache: Optional[Tuple[float, List[Dict[str, Any]]]] = None
+
+# Bumped by every challenge write. A read only fills the caches if no write
+# happened while it was in flight, so it cannot replace fresher data with
+# the snapshot it fetched before the write.
+_challenge_write_count = 0
+
+# (expires_at, today's date string), valid until the next UTC midnight
+_today_cache: Tuple[float, str] = (0.0, "")
+
+# The current day's grammar challenge: date -> challenge
+_grammar_cache: Dict[str, Dict[str, Any]] = {}
+
+# Fields of a complete word_data / idiom record as stored in Firestore
+WORD_DATA_FIELDS = frozenset({
+    "word", "ipa", "meaning", "synonyms", "antonyms", "collocations", "sentences", "forms"
+})
 
 def _init_firebase():
-    """Initializes the Firebase Admin SDK."""
-    global db, bucket
-    
-    if not firebase_admin._apps:
-        try:
-            cred = credentials.Certificate('serviceAccountKey.json')
-            bucket_name = os.getenv("FIREBASE_STORAGE_BUCKET")
-            if not bucket_name:
-                raise ValueError("FIREBASE_STORAGE_BUCKET not found in .env file.")
-                
-            firebase_admin.initialize_app(cred, {
-                'storageBucket': bucket_name
-            })
-            
-            db = firestore.client()
-            bucket = storage.bucket()
-            print("Firebase Admin SDK initialized successfully.")
-            
-        except FileNotFoundError:
-            print("ERROR: serviceAccountKey.json not found.")
-            raise
-        except ValueError as e:
-            print(f"ERROR: {e}")
-            raise
-    else:
-        db = firestore.client()
-        bucket = storage.bucket()
+    """Initializes the Firebase Admin SDK via the shared firebase_client module."""
+    global db
+
+    firebase_client.init_firebase()
+    db = firebase_client.db
+
+
+def _get_aggregate(doc_id: str, field: str) -> Optional[set]:
+    """
+    Reads a set of values from an 'aggregates' document.
+    Returns None if the document has not been backfilled from the full collection yet.
+    """
+    doc = db.collection('aggregates').document(doc_id).get()
+    if not doc.exists:
+        return None
+    data = doc.to_dict()
+    if not data.get("backfilled"):
+        return None
+    return set(data.get(field, []))
+
+def _add_to_aggregate(doc_id: str, field: str, values: Iterable[str], backfilled: bool = False):
+    """
+    Adds values to an 'aggregates' document with an arrayUnion write.
+    Firestore rejects an empty arrayUnion, so with no values only the
+    backfilled marker is written; _get_aggregate treats a missing field as empty.
+    """
+    values = list(values)
+    update: Dict[str, Any] = {}
+    if values:
+        update[field] = firestore.ArrayUnion(values)
+    if backfilled:
+        update["backfilled"] = True
+    if not update:
+        return
+    db.collection('aggregates').document(doc_id).set(update, merge=True)
 
 
 def get_today_str() -> str:
-    """Returns today's date in UTC as 'YYYY-MM-DD'."""
+    """
+    Returns today's date in UTC as 'YYYY-MM-DD'.
+    The string is cached until the next UTC midnight.
+    """
+    global _today_cache
+    if time.time() < _today_cache[0]:
+        return _today_cache[1]
+
     utc_now = datetime.now(timezone.utc)
-    return utc_now.strftime("%Y-%m-%d")
+    next_midnight = (utc_now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    today_str = utc_now.strftime("%Y-%m-%d")
+    _today_cache = (next_midnight.timestamp(), today_str)
+    return today_str
 
 def get_challenge_for_date(date_str: str) -> Optional[Dict[str, Any]]:
     """
     Fetches a challenge document from Firestore by its date (ID).
+    Found challenges are cached for CHALLENGE_CACHE_TTL_SECONDS.
     """
-    if not db:
-        _init_firebase()
-        
+    cached = _challenge_cache.get(date_str)
+    if cached and cached[0] > time.monotonic():
+        return dict(cached[1])
+
+    write_count = _challenge_write_count
     doc_ref = db.collection('challenges').document(date_str)
     doc = doc_ref.get()
     
     if doc.exists:
-        return doc.to_dict()
+        challenge = doc.to_dict()
+        if write_count == _challenge_write_count:
+            _cache_challenge(date_str, challenge)
+        return dict(challenge)
     else:
         return None
 
+def _cache_challenge(date_str: str, challenge: Dict[str, Any]):
+    """Stores a challenge in the TTL cache, dropping expired entries."""
+    now = time.monotonic()
+    for key, (expires_at, _) in list(_challenge_cache.items()):
+        if expires_at <= now:
+            _challenge_cache.pop(key, None)
+    _challenge_cache[date_str] = (now + CHALLENGE_CACHE_TTL_SECONDS, challenge)
+
+def get_challenges_for_dates(date_strs: List[str]) -> List[Dict[str, Any]]:
+    """
+    Fetches several challenge documents in a single batched read.
+    Returns the challenges that exist, in the order the dates were given.
+    """
+    doc_refs = [db.collection('challenges').document(date_str) for date_str in date_strs]
+    found = {doc.id: doc.to_dict() for doc in db.get_all(doc_refs) if doc.exists}
+    return [found[date_str] for date_str in date_strs if date_str in found]
+
 def save_challenge(
     date_str: str, 
     words: List[str], 
     word_data: List[Dict[str, Any]], # Changed to List[Dict]
     story: str, 
     feedback: str,
-    story_image_url: str
+    story_image_url: str,
+    is_new: bool = False
 ):
     """
     Saves or updates a challenge in Firestore using the date as the document ID.
+    Pass is_new=True when the challenge is first created so its words are
+    added to the used-words aggregate; later updates leave the aggregate alone.
     """
-    if not db:
-        _init_firebase()
-        
+    global _all_challenges_cache, _challenge_write_count
     doc_ref = db.collection('challenges').document(date_str)
     
     challenge_data = {
@@ -85,80 +154,101 @@ def save_challenge(
     }
     
     doc_ref.set(challenge_data)
-    print(f"Challenge for {date_str} saved to Firestore.")
+    _challenge_write_count += 1
+    _cache_challenge(date_str, challenge_data)
+    _all_challenges_cache = None
+    if is_new:
+        _add_to_aggregate('used_words', 'words', words)
+    logger.info("Challenge for %s saved to Firestore.", date_str)
+
+def set_story_image_url(date_str: str, story_image_url: str):
+    """
+    Updates only the story image URL of an existing challenge.
+    """
+    global _all_challenges_cache, _challenge_write_count
+    db.collection('challenges').document(date_str).update({"story_image_url": story_image_url})
+    _challenge_write_count += 1
+    _challenge_cache.pop(date_str, None)
+    _all_challenges_cache = None
+    logger.info("Story image for %s saved to Firestore.", date_str)
 
 
 def get_all_used_words() -> set:
     """
     Gets all words that have been used in previous challenges from Firestore.
+    Reads the single 'aggregates/used_words' document, which every worker
+    keeps up to date. The challenges collection is only scanned to backfill
+    the aggregate the first time it is needed.
     """
-    if not db:
-        _init_firebase()
+    used_words = _get_aggregate('used_words', 'words')
+    if used_words is not None:
+        return used_words
         
     used_words = set()
-    docs = db.collection('challenges').stream()
+    docs = db.collection('challenges').select(['words']).stream()
     
     for doc in docs:
         data = doc.to_dict()
         if "words" in data and isinstance(data["words"], list):
             used_words.update(data["words"])
             
+    _add_to_aggregate('used_words', 'words', used_words, backfilled=True)
     return used_words
 
-def get_all_challenges() -> List[Dict[str, Any]]:
+def get_all_challenges(limit: Optional[int] = None, start_after: Optional[str] = None) -> List[Dict[str, Any]]:
     """
-    Gets all challenge documents from Firestore, ordered by date descending.
+    Gets challenge documents from Firestore, ordered by date descending.
+    Pass `limit` to get one page, and the last date of that page as
+    `start_after` to get the next one. Without a limit, all challenges are returned.
+    Only the full, unpaginated list is cached (for CHALLENGE_CACHE_TTL_SECONDS):
+    page cursors come from clients and would let the cache grow without bound.
     """
-    if not db:
-        _init_firebase()
-        
+    global _all_challenges_cache
+    use_cache = limit is None and start_after is None
+    cached = _all_challenges_cache
+    if use_cache and cached and cached[0] > time.monotonic():
+        return [dict(challenge) for challenge in cached[1]]
+
+    write_count = _challenge_write_count
     all_challenges = []
     query = db.collection('challenges').order_by('date', direction=firestore.Query.DESCENDING)
+    if start_after:
+        query = query.start_after({'date': start_after})
+    if limit:
+        query = query.limit(limit)
     docs = query.stream()
     
     for doc in docs:
         all_challenges.append(doc.to_dict())
         
-    return all_challenges
+    if not use_cache or write_count != _challenge_write_count:
+        return all_challenges
 
+    _all_challenges_cache = (time.monotonic() + CHALLENGE_CACHE_TTL_SECONDS, all_challenges)
+    return [dict(challenge) for challenge in all_challenges]
 
-def upload_image_to_storage(image_bytes: bytes, filename: str) -> str:
-    """
-    Uploads raw image bytes to Firebase Storage and returns the public URL.
-    """
-    if not bucket:
-        _init_firebase()
-        
-    try:
-        blob = bucket.blob(filename)
-        blob.upload_from_string(
-            image_bytes,
-            content_type='image/png'
-        )
-        blob.make_public()
-        return blob.public_url
-        
-    except Exception as e:
-        print(f"Error uploading image to Firebase Storage: {e}")
-        return ""
 
 def get_all_used_idioms() -> set:
     """
-    Scans the daily_idioms collection and returns a set of all idioms used so far.
+    Returns a set of all idioms used so far.
+    Reads the single 'aggregates/used_idioms' document, which every worker
+    keeps up to date. The daily_idioms collection is only scanned to backfill
+    the aggregate the first time it is needed.
     """
-    if not db:
-        _init_firebase()
+    used_idioms = _get_aggregate('used_idioms', 'idioms')
+    if used_idioms is not None:
+        return used_idioms
         
-    used_idioms = set()
     docs = db.collection('daily_idioms').stream()
-    
-    for doc in docs:
-        data = doc.to_dict()
-        if "idioms" in data and isinstance(data["idioms"], list):
-            for idiom_obj in data["idioms"]:
-                if "word" in idiom_obj:
-                    used_idioms.add(idiom_obj["word"])
+    used_idioms = {
+        idiom_obj["word"]
+        for data in (doc.to_dict() for doc in docs)
+        if isinstance(data.get("idioms"), list)
+        for idiom_obj in data["idioms"]
+        if "word" in idiom_obj
+    }
             
+    _add_to_aggregate('used_idioms', 'idioms', used_idioms, backfilled=True)
     return used_idioms
 
 def get_or_create_daily_idioms(date_str: str) -> List[Dict[str, Any]]:
@@ -167,9 +257,6 @@ def get_or_create_daily_idioms(date_str: str) -> List[Dict[str, Any]]:
     it generates new, unique ones, saves them, and then returns them.
     This function now validates and cleans data read from the DB.
     """
-    if not db:
-        _init_firebase()
-        
     doc_ref = db.collection('daily_idioms').document(date_str)
     doc = doc_ref.get()
     
@@ -195,6 +282,9 @@ def get_or_create_daily_idioms(date_str: str) -> List[Dict[str, Any]]:
         # Data found. We MUST clean it before returning,
         # in case it's "dirty" data from a past error.
         raw_idioms_from_db = doc.to_dict().get("idioms", [])
+        # Records saved by this function are already clean
+        if all(WORD_DATA_FIELDS <= idiom.keys() for idiom in raw_idioms_from_db):
+            return raw_idioms_from_db
         return _clean_idiom_list(raw_idioms_from_db)
     else:
         # Data not found. Generate, clean, save, and return.
@@ -211,10 +301,55 @@ def get_or_create_daily_idioms(date_str: str) -> List[Dict[str, Any]]:
             
             # 4. Save the clean data
             doc_ref.set(clean_data_to_save) 
+            _add_to_aggregate('used_idioms', 'idioms', [idiom["word"] for idiom in clean_idiom_list])
             
             # 5. Return the clean list
             return clean_idiom_list
             
         except Exception as e:
-            print(f"Error generating and saving daily idioms: {e}")
-            return []
\ No newline at end of file
+            logger.error("Error generating and saving daily idioms: %s", e)
+            return []
+
+def get_or_create_daily_grammar(date_str: str) -> Dict[str, Any]:
+    """
+    Fetches the daily grammar challenge from Firestore. If it doesn't exist,
+    it generates a new one, saves it, and then returns it.
+    One Gemini call per day is shared by every user, and the stored result
+    is kept in memory so later requests skip the Firestore read too.
+    """
+    cached = _grammar_cache.get(date_str)
+    if cached is not None:
+        return cached
+
+    doc_ref = db.collection('daily_grammar').document(date_str)
+    doc = doc_ref.get()
+
+    if doc.exists:
+        grammar_data = doc.to_dict()
+    else:
+        # Data not found. Generate, save, and return.
+        try:
+            grammar_data = llm_utils.generate_grammar_challenge()
+        except Exception as e:
+            # Serve the fallback, but never store it: the next request retries Gemini
+            logger.error("Error generating daily grammar challenge: %s", e)
+            return llm_utils.fallback_grammar_challenge()
+
+        try:
+            # create() fails if another request saved today's challenge first;
+            # everyone then serves that stored one.
+            doc_ref.create(grammar_data)
+        except AlreadyExists:
+            grammar_data = doc_ref.get().to_dict()
+        except Exception as e:
+            # Not stored, so another worker may serve a different challenge;
+            # don't cache it and let the next request retry.
+            logger.error("Error saving daily grammar challenge: %s", e)
+            return grammar_data
+
+    # Cache only what is stored in Firestore, so every worker serves the same
+    # challenge. Only the current day is ever requested, so drop older entries.
+    _grammar_cache.clear()
+    _grammar_cache[date_str] = grammar_data
+    return grammar_data
+
@@ -0,0 +1,42 @@
+import logging
+import os
+import firebase_admin
+from firebase_admin import credentials, firestore, storage
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# --- Globals ---
+db = None
+bucket = None
+
+def init_firebase():
+    """Initializes the Firebase Admin SDK, the Firestore client and the Storage bucket."""
+    global db, bucket
+
+    if not firebase_admin._apps:
+        try:
+            cred = credentials.Certificate('serviceAccountKey.json')
+            bucket_name = os.getenv("FIREBASE_STORAGE_BUCKET")
+            if not bucket_name:
+                raise ValueError("FIREBASE_STORAGE_BUCKET not found in .env file.")
+
+            firebase_admin.initialize_app(cred, {
+                'storageBucket': bucket_name
+            })
+
+            db = firestore.client()
+            bucket = storage.bucket()
+            logger.info("Firebase Admin SDK initialized successfully.")
+
+        except FileNotFoundError:
+            logger.error("serviceAccountKey.json not found.")
+            raise
+        except ValueError as e:
+            logger.error("%s", e)
+            raise
+    else:
+        db = firestore.client()
+        bucket = storage.bucket()
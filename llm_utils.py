@@ -1,10 +1,14 @@
 import google.generativeai as genai
-import json
+import functools
+import logging
+import orjson
 import os
 import re
 from dotenv import load_dotenv
 from typing import List, Tuple, Dict, Any
 
+logger = logging.getLogger(__name__)
+
 # --- Configuration ---
 load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
@@ -29,22 +33,37 @@ SAFETY_SETTINGS = [
 # Config for forcing JSON output from the text model
 JSON_CONFIG = genai.GenerationConfig(response_mime_type="application/json")
 
+# Matches a markdown ```json ... ``` fence around a JSON object
+_JSON_FENCE_RE = re.compile(r'```json\s*(\{.*\})\s*```', re.DOTALL)
+
 
+@functools.lru_cache(maxsize=None)
 def _get_text_model() -> genai.GenerativeModel:
-    """Returns an instance of the text generation model."""
+    """Returns the shared instance of the text generation model."""
     return genai.GenerativeModel(TEXT_MODEL_NAME, safety_settings=SAFETY_SETTINGS)
 
+@functools.lru_cache(maxsize=None)
 def _get_image_model() -> genai.GenerativeModel:
-    """Returns an instance of the image generation model."""
+    """Returns the shared instance of the image generation model."""
     return genai.GenerativeModel(IMAGE_MODEL_NAME, safety_settings=SAFETY_SETTINGS)
 
 def _clean_json_response(response_text: str) -> str:
     """Cleans the typical markdown ```json ... ``` wrapper from the model response."""
-    match = re.search(r'```json\s*(\{.*\})\s*```', response_text, re.DOTALL)
+    match = _JSON_FENCE_RE.search(response_text)
     if match:
         return match.group(1)
     return response_text # Return as-is if no wrapper found
 
+def _parse_json_response(response_text: str) -> Any:
+    """
+    Parses a response generated with JSON_CONFIG.
+    JSON mode returns bare JSON, so the markdown clean-up only runs if parsing fails.
+    """
+    try:
+        return orjson.loads(response_text)
+    except orjson.JSONDecodeError:
+        return orjson.loads(_clean_json_response(response_text))
+
 # --- API Functions (Rewritten for Gemini) ---
 def get_llm_vocab_batch(words: List[str]) -> List[Tuple]:
     """
@@ -71,7 +90,7 @@ def get_llm_vocab_batch(words: List[str]) -> List[Tuple]:
     
     user_prompt = f"Generate the vocabulary data for these 5 words: {', '.join(words)}"
     
-    print(f"Calling Gemini for vocab batch: {', '.join(words)}...")
+    logger.info("Calling Gemini for vocab batch: %s...", words)
     
     try:
         response = model.generate_content(
@@ -79,8 +98,8 @@ def get_llm_vocab_batch(words: List[str]) -> List[Tuple]:
             generation_config=JSON_CONFIG
         )
         
-        response_text = _clean_json_response(response.text)
-        data = json.loads(response_text)
+        response_text = response.text
+        data = _parse_json_response(response_text)
         word_list = data.get("word_data", [])
         
         results = []
@@ -99,11 +118,11 @@ def get_llm_vocab_batch(words: List[str]) -> List[Tuple]:
         if not results:
              raise Exception("AI returned empty word data.")
              
-        print("Gemini vocab batch successful.")
+        logger.info("Gemini vocab batch successful.")
         return results
         
     except Exception as e:
-        print(f"Error decoding JSON from Gemini (vocab): {e}")
+        logger.error("Error decoding JSON from Gemini (vocab): %s", e)
         return [
             (word, "N/A", "Error loading data.", "N/A", "N/A", "N/A", [], "N/A") for word in words
         ]
@@ -133,7 +152,7 @@ def get_story_feedback(story: str) -> str:
     
     user_prompt = f"Here is the story: \n---\n{story}\n---"
     
-    print("Calling Gemini for story feedback...")
+    logger.info("Calling Gemini for story feedback...")
     try:
         response = model.generate_content([system_prompt, user_prompt])
         feedback = response.text
@@ -141,18 +160,29 @@ def get_story_feedback(story: str) -> str:
         if "### Corrections:" not in feedback: # Basic validation
             raise Exception("AI did not follow feedback format.")
             
-        print("Gemini story feedback successful.")
+        logger.info("Gemini story feedback successful.")
         return feedback
         
     except Exception as e:
-        print(f"Error from Gemini (feedback): {e}")
+        logger.error("Error from Gemini (feedback): %s", e)
         return f"### Corrections:\nNone.\n\n### Suggestions:\nGreat job using the words!\n\n### Best Version:\n{story}"
 
 
 def lookup_word(word_to_lookup: str) -> tuple:
     """
     Looks up a single word using Gemini.
+    Results are cached per normalized word; failed lookups are not cached.
     """
+    try:
+        return _lookup_word_cached(word_to_lookup.strip().lower())
+    except Exception as e:
+        logger.error("Error decoding JSON from Gemini (lookup): %s", e)
+        return (word_to_lookup, "N/A", "Error loading data.", "N/A", "N/A", "N/A", [], "N/A")
+
+
+@functools.lru_cache(maxsize=4096)
+def _lookup_word_cached(word_to_lookup: str) -> tuple:
+    """Calls Gemini for a single word. Raises on failure so errors are never cached."""
     model = _get_text_model()
     
     system_prompt = """
@@ -172,35 +202,31 @@ def lookup_word(word_to_lookup: str) -> tuple:
     
     user_prompt = f"Generate the vocabulary data for this word: {word_to_lookup}"
     
-    print(f"Calling Gemini for word lookup: {word_to_lookup}...")
-    try:
-        response = model.generate_content(
-            [system_prompt, user_prompt],
-            generation_config=JSON_CONFIG
-        )
-        response_text = _clean_json_response(response.text)
-        item = json.loads(response_text)
-        
-        print("Gemini lookup successful.")
-        return (
-            item.get("word", word_to_lookup),
-            item.get("ipa", ""),
-            item.get("meaning", ""),
-            item.get("synonyms", ""),
-            item.get("antonyms", ""),
-            item.get("collocations", ""),
-            item.get("sentences", []),
-            item.get("forms", "")  # <-- ADDED "forms"
-        )
-    except Exception as e:
-        print(f"Error decoding JSON from Gemini (lookup): {e}")
-        return (word_to_lookup, "N/A", "Error loading data.", "N/A", "N/A", "N/A", [], "N/A")
+    logger.info("Calling Gemini for word lookup: %s...", word_to_lookup)
+    response = model.generate_content(
+        [system_prompt, user_prompt],
+        generation_config=JSON_CONFIG
+    )
+    response_text = response.text
+    item = _parse_json_response(response_text)
+    
+    logger.info("Gemini lookup successful.")
+    return (
+        item.get("word", word_to_lookup),
+        item.get("ipa", ""),
+        item.get("meaning", ""),
+        item.get("synonyms", ""),
+        item.get("antonyms", ""),
+        item.get("collocations", ""),
+        item.get("sentences", []),
+        item.get("forms", "")  # <-- ADDED "forms"
+    )
 
 
-def get_grammar_challenge() -> dict:
+def generate_grammar_challenge() -> dict:
     """
     Generates a new grammar challenge using Gemini.
-    Returns a Python dictionary.
+    Raises on failure, so callers can tell a real challenge from the fallback.
     """
     model = _get_text_model()
     
@@ -220,31 +246,34 @@ def get_grammar_challenge() -> dict:
     
     user_prompt = "Generate a new grammar challenge with 2 problems."
     
-    print("Calling Gemini for grammar challenge...")
+    logger.info("Calling Gemini for grammar challenge...")
+    response = model.generate_content(
+        [system_prompt, user_prompt],
+        generation_config=JSON_CONFIG
+    )
+    response_text = response.text
     try:
-        response = model.generate_content(
-            [system_prompt, user_prompt],
-            generation_config=JSON_CONFIG
-        )
-        response_text = _clean_json_response(response.text)
-        data = json.loads(response_text)
-        
-        if "title" not in data: # Basic validation
+        data = _parse_json_response(response_text)
+        if not isinstance(data, dict) or "title" not in data: # Basic validation
             raise Exception("Invalid JSON structure from AI")
-            
-        print("Gemini grammar challenge successful.")
-        return data
-    except Exception as e:
-        print(f"Error decoding JSON from Gemini (grammar): {e}")
-        print(f"Raw response was: {response_text}")
-        return {
-          "title": "Grammar Fix-Up: Your/You're",
-          "description": "Correct the grammar in the sentences below. (Error: Could not load from AI)",
-          "problems": [
-            { "id": 1, "incorrect": "Your going to be late.", "correct": "You're going to be late." },
-            { "id": 2, "incorrect": "Is this you're book?", "correct": "Is this your book?" }
-          ]
-        }
+    except Exception:
+        logger.error("Raw response was: %s", response_text)
+        raise
+        
+    logger.info("Gemini grammar challenge successful.")
+    return data
+
+
+def fallback_grammar_challenge() -> dict:
+    """Returns the fixed grammar challenge served when Gemini fails."""
+    return {
+      "title": "Grammar Fix-Up: Your/You're",
+      "description": "Correct the grammar in the sentences below. (Error: Could not load from AI)",
+      "problems": [
+        { "id": 1, "incorrect": "Your going to be late.", "correct": "You're going to be late." },
+        { "id": 2, "incorrect": "Is this you're book?", "correct": "Is this your book?" }
+      ]
+    }
 
 
 def generate_image_with_gemini(story: str) -> bytes:
@@ -263,42 +292,41 @@ def generate_image_with_gemini(story: str) -> bytes:
     "{story}"
     """
     
-    print(f"Calling Gemini Image Model ({IMAGE_MODEL_NAME}) for story...")
+    logger.info("Calling Gemini Image Model (%s) for story...", IMAGE_MODEL_NAME)
     try:
         response = model.generate_content(prompt)
         
         # 1. Check for safety blocks
         if response.prompt_feedback.block_reason:
-            print(f"Error: Image generation blocked due to: {response.prompt_feedback.block_reason}")
+            logger.error("Image generation blocked due to: %s", response.prompt_feedback.block_reason)
             return None
 
         # --- (THIS IS THE FIX) ---
-        # 2. Iterate through all parts to find the image
-        #    The model sends text AND an image in different parts.
-        #    We must loop through all parts to find the one with image data.
-        
-        image_bytes = None
-        for part in response.candidates[0].content.parts:
-            if part.inline_data.data:
-                image_bytes = part.inline_data.data
-                break # Found the image, stop looking
-            elif part.text:
-                # Log the text part for debugging, but don't fail
-                print(f"Model also returned text") 
+        # 2. Find the first part with image data
+        #    The model sends text AND an image in different parts,
+        #    and text parts have no inline_data.
+        image_bytes = next(
+            (
+                part.inline_data.data
+                for part in response.candidates[0].content.parts
+                if getattr(part, "inline_data", None) is not None and part.inline_data.data
+            ),
+            None
+        )
 
-        # 3. Check if we found image bytes after the loop
+        # 3. Check if we found image bytes
         if image_bytes:
-            print("Gemini Image generation successful.")
+            logger.info("Gemini Image generation successful.")
             return image_bytes
         else:
             # No image was found in any part
-            print("Error: Model response did not contain any image data (and was not blocked).")
-            # print(f"DEBUG: Full candidate: {response.candidates[0]}") 
+            logger.error("Model response did not contain any image data (and was not blocked).")
+            # logger.debug("Full candidate: %s", response.candidates[0])
             return None
         # --- (END OF FIX) ---
             
     except Exception as e:
-        print(f"Error during image generation API call: {str(e)}")
+        logger.error("Error during image generation API call: %s", e)
         return None
 
 def get_daily_idioms(avoid_list: set = set()) -> dict:
@@ -343,22 +371,22 @@ def get_daily_idioms(avoid_list: set = set()) -> dict:
     
     user_prompt = "Generate two new, different daily idioms that are not in my avoid list."
     
-    print("Calling Gemini for 2 daily idioms...")
+    logger.info("Calling Gemini for 2 daily idioms...")
     try:
         response = model.generate_content(
             [system_prompt, user_prompt],
             generation_config=JSON_CONFIG
         )
-        response_text = _clean_json_response(response.text)
-        data = json.loads(response_text)
+        response_text = response.text
+        data = _parse_json_response(response_text)
         
         if "idioms" not in data or len(data["idioms"]) < 2:
             raise Exception("Invalid JSON structure from AI")
             
-        print("Gemini daily idioms successful.")
+        logger.info("Gemini daily idioms successful.")
         return data
     except Exception as e:
-        print(f"Error decoding JSON from Gemini (idioms): {e}")
+        logger.error("Error decoding JSON from Gemini (idioms): %s", e)
         # Fallback with the required 'forms' key
         return { "idioms": [
             {
@@ -1,36 +1,57 @@
+import asyncio
+import functools
 import random
 import io
 import re
 import json
+import logging
+import orjson
 import os
 import base64
-import uuid
-from fastapi import FastAPI, HTTPException, Query, Request
+from contextlib import asynccontextmanager
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, JSONResponse, ORJSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 from gtts import gTTS
 
+# Configure logging for the app and its helper modules
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
 # Import your existing logic files
 import db_utils
 import llm_utils
+import storage_utils
 
 # --- Constants ---
 WORDS_PER_DAY = 5
 OXFORD_WORDS_PATH = "oxford_5000.txt"
 
-# --- (THIS IS THE FIX) ---
-# Initialize Firebase on app startup
-db_utils._init_firebase()
-# --- (END OF FIX) ---
+# Load the word list once at startup. An empty list is reported by /api/today.
+try:
+    with open(OXFORD_WORDS_PATH) as f:
+        _ALL_WORDS = tuple(word for word in (line.strip() for line in f) if word and word[0].isalpha())
+except FileNotFoundError:
+    logger.error("Word list file '%s' not found", OXFORD_WORDS_PATH)
+    _ALL_WORDS = ()
+_ALL_WORDS_SET = frozenset(_ALL_WORDS)
 
 # --- App Setup ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Initialize Firebase on app startup, not at import time
+    await asyncio.to_thread(db_utils._init_firebase)
+    yield
+
 app = FastAPI(
     title="FluentLeap API",
     description="English vocabulary learning API",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # NOTE: We no longer need the /images static mount
@@ -100,27 +121,33 @@ class GrammarChallenge(BaseModel):
     
 
 # --- Helper Function ---
-def _format_word_data(word_data_list: List[Any]) -> List[Dict[str, str]]:
+def _format_word_data(word_data_list: List[Any], from_db: bool = True) -> List[Dict[str, str]]:
     """
     Safely formats word data from Firestore (list of lists) to a list of dicts.
-    Now handles 8 items per record.
+    Now handles 8 items per record. Pass from_db=False for fresh LLM output so
+    every record is rebuilt with only the expected fields.
     """
     formatted_data = []
     if not word_data_list:
         return formatted_data
 
+    # Records read back from Firestore are already complete dicts
+    if from_db and all(isinstance(item, dict) and db_utils.WORD_DATA_FIELDS <= item.keys() for item in word_data_list):
+        return word_data_list
+
     for item in word_data_list:
         # Handle 8-item tuple from LLM
         if isinstance(item, (list, tuple)) and len(item) >= 8:
+            word, ipa, meaning, synonyms, antonyms, collocations, sentences, forms = item[:8]
             formatted_data.append({
-                "word": item[0] if len(item) > 0 else "",
-                "ipa": item[1] if len(item) > 1 else "",
-                "meaning": item[2] if len(item) > 2 else "",
-                "synonyms": item[3] if len(item) > 3 else "",
-                "antonyms": item[4] if len(item) > 4 else "",
-                "collocations": item[5] if len(item) > 5 else "",
-                "sentences": item[6] if len(item) > 6 else [],
-                "forms": item[7] if len(item) > 7 else ""  # <-- ADDED "forms"
+                "word": word,
+                "ipa": ipa,
+                "meaning": meaning,
+                "synonyms": synonyms,
+                "antonyms": antonyms,
+                "collocations": collocations,
+                "sentences": sentences,
+                "forms": forms
             })
         # Handle data already formatted in Firestore
         elif isinstance(item, dict):
@@ -136,9 +163,16 @@ def _format_word_data(word_data_list: List[Any]) -> List[Dict[str, str]]:
             })
     return formatted_data
 
+@functools.lru_cache(maxsize=2048)
+def _tts_bytes(word: str) -> bytes:
+    """Synthesizes the pronunciation of a word as MP3 bytes. Cached per word."""
+    mp3_fp = io.BytesIO()
+    gTTS(word, lang="en", tld="com").write_to_fp(mp3_fp)
+    return mp3_fp.getvalue()
+
 
 # --- API Endpoints ---
-@app.get("/api/today", response_model=ChallengeResponse)
+@app.get("/api/today", responses={200: {"model": ChallengeResponse}})
 async def get_today_challenge():
     """
     Gets today's 5 words AND the daily idioms.
@@ -146,11 +180,13 @@ async def get_today_challenge():
     """
     today_str = db_utils.get_today_str()
 
-    # 1. Get the daily idioms (list of dicts)
-    daily_idioms = db_utils.get_or_create_daily_idioms(today_str)
-
+    # 1. Get the daily idioms (list of dicts) and
     # 2. Get the daily word challenge
-    today_record = db_utils.get_challenge_for_date(today_str) 
+    # These are independent, so run both Firestore round-trips concurrently.
+    daily_idioms, today_record = await asyncio.gather(
+        asyncio.to_thread(db_utils.get_or_create_daily_idioms, today_str),
+        asyncio.to_thread(db_utils.get_challenge_for_date, today_str),
+    )
 
     if today_record:
         # Challenge already exists
@@ -160,14 +196,11 @@ async def get_today_challenge():
     else:
         # Create new word challenge
         # ... (your existing word generation logic is fine) ...
-        try:
-            with open(OXFORD_WORDS_PATH) as f:
-                all_words = [line.strip() for line in f if line.strip() and line[0].isalpha()]
-        except FileNotFoundError:
+        if not _ALL_WORDS:
             raise HTTPException(status_code=500, detail=f"Word list file '{OXFORD_WORDS_PATH}' not found")
 
-        all_used_words = db_utils.get_all_used_words()
-        unused = list(set(all_words) - set(all_used_words))
+        all_used_words = await asyncio.to_thread(db_utils.get_all_used_words)
+        unused = tuple(_ALL_WORDS_SET.difference(all_used_words))
 
         todays_words = []
         if len(unused) >= WORDS_PER_DAY:
@@ -175,20 +208,22 @@ async def get_today_challenge():
         elif 0 < len(unused) < WORDS_PER_DAY:
             todays_words = random.sample(unused, len(unused))
         else:
-            print("Warning: All unique words have been used. Resetting word list.")
-            todays_words = random.sample(all_words, WORDS_PER_DAY)
+            logger.warning("All unique words have been used. Resetting word list.")
+            todays_words = random.sample(_ALL_WORDS, WORDS_PER_DAY)
 
         if todays_words:
-            todays_word_data_tuples = llm_utils.get_llm_vocab_batch(todays_words)
-            formatted_word_data = _format_word_data(todays_word_data_tuples)
+            todays_word_data_tuples = await asyncio.to_thread(llm_utils.get_llm_vocab_batch, todays_words)
+            formatted_word_data = _format_word_data(todays_word_data_tuples, from_db=False)
 
-            db_utils.save_challenge(
+            await asyncio.to_thread(
+                db_utils.save_challenge,
                 today_str, 
                 todays_words, 
                 formatted_word_data,
                 story="",
                 feedback="",
-                story_image_url=""
+                story_image_url="",
+                is_new=True
             )
 
             return {
@@ -203,68 +238,77 @@ async def get_today_challenge():
         else:
             raise HTTPException(status_code=500, detail="No words available to load")
 
+def _finish_story_image(today_str: str, story: str):
+    """
+    Generates the story image, uploads it, and stores its URL on the challenge.
+    Runs as a background task after /api/story has responded.
+    """
+    # 1. Generate image with Gemini
+    image_bytes = llm_utils.generate_image_with_gemini(story)
+    if not image_bytes:
+        return
+
+    try:
+        # 2. Create a unique filename
+        filename = f"story-images/story-{today_str}-{os.urandom(16).hex()}.webp"
+        
+        # 3. Upload to Firebase Storage
+        story_image_url = storage_utils.upload_image_to_storage(image_bytes, filename)
+        
+        if story_image_url:
+            logger.info("Image uploaded to: %s", story_image_url)
+            # 4. Attach the new public URL to the challenge
+            db_utils.set_story_image_url(today_str, story_image_url)
+        else:
+            logger.error("Image upload failed, URL is empty.")
+        
+    except Exception as e:
+        logger.error("Error saving image: %s", e)
+
 @app.post("/api/story", response_model=FeedbackResponse)
-async def save_story(story_request: StoryRequest):
+async def save_story(story_request: StoryRequest, background_tasks: BackgroundTasks):
     """
-    Receives a story, gets feedback, GENERATES AN IMAGE, and saves all to DB.
+    Receives a story, gets feedback, and saves both to DB.
+    The story image is generated and uploaded in the background.
     """
     story = story_request.story
     if not story:
         raise HTTPException(status_code=400, detail="No story provided")
 
     today_str = db_utils.get_today_str()
-    today_record = db_utils.get_challenge_for_date(today_str)
+    today_record = await asyncio.to_thread(db_utils.get_challenge_for_date, today_str)
     
     if not today_record:
         raise HTTPException(status_code=404, detail="Today's challenge not found. Please GET /api/today first.")
 
     # 1. Get text feedback (from Gemini)
-    feedback = llm_utils.get_story_feedback(story)
-    
-    story_image_url = "" # Default empty string
-    
-    # 2. Generate image with Gemini
-    image_bytes = llm_utils.generate_image_with_gemini(story)
-    
-    if image_bytes:
-        try:
-            # --- (THIS IS THE FIX) ---
-            # 3. Create a unique filename
-            filename = f"story-images/story-{today_str}-{uuid.uuid4()}.png"
-            
-            # 4. Upload to Firebase Storage
-            story_image_url = db_utils.upload_image_to_storage(image_bytes, filename)
-            
-            if story_image_url:
-                print(f"Image uploaded to: {story_image_url}")
-            else:
-                print("Error: Image upload failed, URL is empty.")
-            # --- (END OF FIX) ---
-            
-        except Exception as e:
-            print(f"Error saving image: {str(e)}")
-
-    # 5. Save everything to Firestore
-    # NOTE: We must pass _format_word_data to save_challenge,
-    # because the record from the DB `today_record.get("word_data", [])`
-    # is already formatted as a list of dicts.
-    db_utils.save_challenge(
+    feedback = await asyncio.to_thread(llm_utils.get_story_feedback, story)
+
+    # 2. Save the story and feedback to Firestore
+    # The stored word_data is written back as-is: it was already
+    # formatted as a list of dicts when the challenge was created.
+    # The image URL is filled in once the background upload finishes.
+    await asyncio.to_thread(
+        db_utils.save_challenge,
         today_str, 
         today_record["words"], 
-        _format_word_data(today_record.get("word_data", [])),
+        today_record.get("word_data", []),
         story, 
         feedback,
-        story_image_url # <-- Pass the new public URL
+        story_image_url=""
     )
+
+    # 3. Generate and upload the image after responding
+    background_tasks.add_task(_finish_story_image, today_str, story)
     
     return {"feedback": feedback}
 
-@app.get("/api/lookup", response_model=LookupResponse)
+@app.get("/api/lookup", responses={200: {"model": LookupResponse}})
 async def lookup_word_endpoint(word: str = Query(..., description="Word to lookup")):
     if not word:
         raise HTTPException(status_code=400, detail="No word parameter provided")
     try:
-        data = llm_utils.lookup_word(word)
+        data = await asyncio.to_thread(llm_utils.lookup_word, word)
         response_data = {
             "word": data[0], "ipa": data[1], "meaning": data[2],
             "synonyms": data[3], "antonyms": data[4],
@@ -275,59 +319,62 @@ async def lookup_word_endpoint(word: str = Query(..., description="Word to looku
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to lookup word: {str(e)}")
 
-@app.get("/api/history", response_model=List[ChallengeResponse])
-async def get_history():
-    # Now reads from Firestore
-    all_challenges = db_utils.get_all_challenges()
-    formatted_challenges = []
-    for challenge in all_challenges:
-        formatted_challenge = challenge.copy()
-        formatted_challenge["word_data"] = _format_word_data(challenge.get("word_data", []))
-        formatted_challenges.append(formatted_challenge)
-    return formatted_challenges
-
-@app.get("/api/review-words", response_model=List[WordData])
+@app.get("/api/history", responses={200: {"model": List[ChallengeResponse]}})
+async def get_history(
+    limit: Optional[int] = Query(None, ge=1, description="Max number of challenges to return"),
+    cursor: Optional[str] = Query(None, description="Return challenges older than this date (YYYY-MM-DD)")
+):
+    # Now reads from Firestore, optionally one page at a time
+    all_challenges = await asyncio.to_thread(db_utils.get_all_challenges, limit, cursor)
+
+    async def _stream_challenges():
+        # Encode one challenge at a time instead of the whole list at once.
+        # get_all_challenges returns copies, so they can be formatted in place.
+        yield b"["
+        for i, challenge in enumerate(all_challenges):
+            challenge["word_data"] = _format_word_data(challenge.get("word_data", []))
+            yield (b"," if i else b"") + orjson.dumps(challenge)
+        yield b"]"
+
+    return StreamingResponse(_stream_challenges(), media_type="application/json")
+
+@app.get("/api/review-words", responses={200: {"model": List[WordData]}})
 async def get_review_words():
     # Now reads from Firestore
-    all_challenges = db_utils.get_all_challenges()
-    all_word_data = []
+    all_challenges = await asyncio.to_thread(db_utils.get_all_challenges)
+    # Keyed by word: keeps the first occurrence of each word
+    unique = {}
     for entry in all_challenges:
-        all_word_data.extend(_format_word_data(entry.get("word_data", [])))
-    
-    seen_words = set()
-    unique_words = []
-    for data in all_word_data:
-        word = data["word"]
-        if word not in seen_words:
-            seen_words.add(word)
-            unique_words.append(data)
+        for data in _format_word_data(entry.get("word_data", [])):
+            unique.setdefault(data["word"], data)
     
+    unique_words = list(unique.values())
     random.shuffle(unique_words)
     return unique_words
 
 @app.get("/api/audio")
 async def get_audio(word: str = Query(..., description="Word to pronounce")):
-    # This endpoint needs no changes
     if not word:
         raise HTTPException(status_code=400, detail="No word parameter provided")
     try:
-        tts = gTTS(word, lang="en", tld="com")
-        mp3_fp = io.BytesIO()
-        tts.write_to_fp(mp3_fp)
-        mp3_fp.seek(0)
-        return StreamingResponse(
-            mp3_fp,
+        mp3_bytes = await asyncio.to_thread(_tts_bytes, word.strip().lower())
+        return Response(
+            mp3_bytes,
             media_type="audio/mpeg",
-            headers={"Content-Disposition": f'inline; filename="{word}.mp3"'}
+            headers={
+                "Content-Disposition": f'inline; filename="{word}.mp3"',
+                "Cache-Control": "public, max-age=86400"
+            }
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate audio: {str(e)}")
 
 @app.get("/api/grammar", response_model=GrammarChallenge)
 async def get_grammar_challenge_endpoint():
-    # This endpoint needs no changes
+    # One grammar challenge per day, stored in Firestore
+    today_str = db_utils.get_today_str()
     try:
-        challenge_data = llm_utils.get_grammar_challenge()
+        challenge_data = await asyncio.to_thread(db_utils.get_or_create_daily_grammar, today_str)
         return challenge_data
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate grammar challenge: {str(e)}")
@@ -349,4 +396,16 @@ if __name__ == '__main__':
     print("📡 Server will be available at: http://localhost:8000")
     print("📚 API docs will be available at: http://localhost:8000/docs")
     print("✅  API is now using Google Gemini and Firebase.")
-    uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
\ No newline at end of file
+    # uvicorn's default "auto" loop/http pick uvloop and httptools when
+    # uvicorn[standard] installed them. Workers need the app as an import
+    # string; each worker initializes its own Firebase client. One worker by
+    # default: challenge caches are per process, so with more workers a
+    # submitted story can take up to CHALLENGE_CACHE_TTL_SECONDS to show
+    # everywhere. Set WEB_CONCURRENCY to opt in.
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        log_level="info",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1"))
+    )
\ No newline at end of file
@@ -1,20 +1,19 @@
-import json
+import orjson
 import os
-import uuid
-import firebase_admin
-from firebase_admin import credentials, firestore, storage
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any
 from dotenv import load_dotenv
 
+# Shares the app's Firebase setup and storage helpers without pulling in the LLM module
+import firebase_client
+import storage_utils
+
 # --- Configuration ---
 load_dotenv() # Load variables from .env file
 DB_JSON_FILE = "db.json"
-SERVICE_ACCOUNT_KEY_FILE = "serviceAccountKey.json"
 LOCAL_IMAGE_DIR = "image_storage"
-
-# --- Globals ---
-db = None
-bucket = None
+FIRESTORE_BATCH_LIMIT = 500 # Max writes per Firestore batch
+IMAGE_UPLOAD_WORKERS = 10
 
 # --- Helper Function (copied from your main.py) ---
 def _format_word_data(word_data_list: List[Any]) -> List[Dict[str, str]]:
@@ -39,63 +38,66 @@ def _format_word_data(word_data_list: List[Any]) -> List[Dict[str, str]]:
             formatted_data.append(item)
     return formatted_data
 
-# --- Firebase & Storage Functions ---
-def _init_firebase():
-    """Initializes the Firebase Admin SDK for Firestore AND Storage."""
-    global db, bucket
-    
-    if not firebase_admin._apps:
-        try:
-            cred = credentials.Certificate(SERVICE_ACCOUNT_KEY_FILE)
-            bucket_name = os.getenv("FIREBASE_STORAGE_BUCKET")
-            
-            if not bucket_name:
-                raise ValueError("FIREBASE_STORAGE_BUCKET not found in .env file. Please check it.")
-                
-            firebase_admin.initialize_app(cred, {
-                'storageBucket': bucket_name
-            })
-            
-            db = firestore.client()
-            bucket = storage.bucket()
-            print("✓ Firebase initialized successfully (Firestore & Storage).")
-            
-        except FileNotFoundError:
-            print(f"🔥 ERROR: '{SERVICE_ACCOUNT_KEY_FILE}' not found.")
-            raise
-        except ValueError as e:
-            print(f"🔥 ERROR: {e}")
-            raise
-
-def upload_image_to_storage(image_bytes: bytes, filename: str) -> str:
+def _migrate_image(entry: Dict[str, Any]) -> str:
     """
-    Uploads raw image bytes to Firebase Storage and returns the public URL.
+    Uploads an entry's local story image to Firebase Storage.
+    Returns the new public URL, or "" if there is no image or the upload failed.
+    Never raises, so one bad entry cannot abort the whole migration.
     """
-    if not bucket:
-        _init_firebase()
+    date_str = entry["date"]
     try:
-        blob = bucket.blob(filename)
-        blob.upload_from_string(image_bytes, content_type='image/png')
-        blob.make_public()
-        return blob.public_url
+        old_image_url = entry.get("story_image_url", "")
+        if not old_image_url:
+            return ""
+
+        # 1. Find local file
+        filename = old_image_url.replace("/images/", "")
+        local_path = os.path.join(LOCAL_IMAGE_DIR, filename)
+        
+        if not os.path.exists(local_path):
+            print(f"  -> Warning: Image file for {date_str} not found at {local_path}. Skipping image.")
+            return ""
+
+        print(f"  -> Found local image for {date_str}: {local_path}")
+        
+        # 2. Stream the file to Firebase without reading it into memory
+        new_firebase_filename = f"story-images/migrated-{date_str}-{os.urandom(16).hex()}.png"
+        new_image_url = storage_utils.upload_image_file_to_storage(local_path, new_firebase_filename)
+        
+        if new_image_url:
+            print(f"  -> ✓ Successfully uploaded image for {date_str} to: {new_image_url}")
+        else:
+            print(f"  -> 🔥 Failed to upload image for {date_str}.")
+        return new_image_url
+
     except Exception as e:
-        print(f"  -> 🔥 Error uploading to Firebase Storage: {e}")
+        print(f"  -> 🔥 ERROR migrating image for {date_str}: {e}")
         return ""
 
+def _commit_batch(batch, batch_dates: List[str]) -> bool:
+    """Commits a Firestore write batch. Returns True on success."""
+    try:
+        batch.commit()
+        print(f"  -> ✓ Uploaded data for {len(batch_dates)} entries ({batch_dates[0]} to {batch_dates[-1]})")
+        return True
+    except Exception as e:
+        print(f"🔥 ERROR uploading entries {batch_dates[0]} to {batch_dates[-1]}: {e}")
+        return False
+
 # --- Main Migration Logic ---
 def migrate_data():
     print("Starting migration (with image upload)...")
     
     try:
-        _init_firebase()
+        firebase_client.init_firebase()
     except Exception as e:
         print("Migration aborted.")
         return
 
     # 1. Read db.json
     try:
-        with open(DB_JSON_FILE, 'r') as f:
-            data = json.load(f)
+        with open(DB_JSON_FILE, 'rb') as f:
+            data = orjson.loads(f.read())
         
         # Handle TinyDB's two possible formats
         challenges = []
@@ -103,12 +105,13 @@ def migrate_data():
             challenges = data.get('challenges', {}).values() # Old format
         elif 'challenges' in data and isinstance(data['challenges'], list):
             challenges = data['challenges'] # New format
+        challenges = list(challenges)
         
         if not challenges:
             print(f"🔥 ERROR: Could not find 'challenges' in {DB_JSON_FILE}.")
             return
                 
-        print(f"✓ Read {len(list(challenges))} entries from {DB_JSON_FILE}.")
+        print(f"✓ Read {len(challenges)} entries from {DB_JSON_FILE}.")
         
     except FileNotFoundError:
         print(f"🔥 ERROR: {DB_JSON_FILE} not found.")
@@ -117,51 +120,32 @@ def migrate_data():
         print(f"🔥 ERROR: Could not read {DB_JSON_FILE}. Details: {e}")
         return
 
-    # 2. Loop and Upload to Firestore
-    challenge_collection = db.collection('challenges')
     success_count = 0
     fail_count = 0
+
+    # 2. Upload images to Firebase Storage in parallel
+    entries = []
+    for entry in challenges:
+        if not isinstance(entry, dict) or not entry.get("date"):
+            print(f"Warning: Skipping entry with no date: {entry}")
+            fail_count += 1
+            continue
+        entries.append(entry)
+
+    print("Beginning image upload to Firebase Storage...")
+    with ThreadPoolExecutor(max_workers=IMAGE_UPLOAD_WORKERS) as pool:
+        new_image_urls = list(pool.map(_migrate_image, entries))
+
+    # 3. Write challenges to Firestore in batches
+    challenge_collection = firebase_client.db.collection('challenges')
     
     print("Beginning upload to Firestore...")
 
-    for entry in challenges:
+    batch = firebase_client.db.batch()
+    batch_dates = []
+    for entry, new_image_url in zip(entries, new_image_urls):
+        date_str = entry["date"]
         try:
-            date_str = entry.get("date")
-            if not date_str:
-                print(f"Warning: Skipping entry with no date: {entry}")
-                fail_count += 1
-                continue
-            
-            print(f"\nProcessing entry for {date_str}...")
-            
-            # --- Image Migration Logic ---
-            new_image_url = "" # Default to empty
-            old_image_url = entry.get("story_image_url", "")
-            
-            if old_image_url:
-                # 1. Find local file
-                filename = old_image_url.replace("/images/", "")
-                local_path = os.path.join(LOCAL_IMAGE_DIR, filename)
-                
-                if os.path.exists(local_path):
-                    print(f"  -> Found local image: {local_path}")
-                    
-                    # 2. Read file bytes
-                    with open(local_path, "rb") as f:
-                        image_bytes = f.read()
-                    
-                    # 3. Upload to Firebase
-                    new_firebase_filename = f"story-images/migrated-{date_str}-{uuid.uuid4()}.png"
-                    new_image_url = upload_image_to_storage(image_bytes, new_firebase_filename)
-                    
-                    if new_image_url:
-                        print(f"  -> ✓ Successfully uploaded to: {new_image_url}")
-                    else:
-                        print(f"  -> 🔥 Failed to upload image.")
-                else:
-                    print(f"  -> Warning: Image file not found at {local_path}. Skipping image.")
-            # --- End Image Logic ---
-
             # Format word_data from list-of-lists to list-of-dicts
             formatted_word_data = _format_word_data(entry.get("word_data", []))
 
@@ -176,16 +160,27 @@ def migrate_data():
             }
             
             # Use the date as the document ID to prevent duplicates
-            doc_ref = challenge_collection.document(date_str)
-            doc_ref.set(payload)
-            
-            print(f"  -> ✓ Uploaded data for {date_str}")
-            success_count += 1
+            batch.set(challenge_collection.document(date_str), payload)
+            batch_dates.append(date_str)
             
         except Exception as e:
-            print(f"🔥 ERROR uploading entry for {date_str}: {e}")
+            print(f"🔥 ERROR preparing entry for {date_str}: {e}")
             fail_count += 1
 
+        if len(batch_dates) == FIRESTORE_BATCH_LIMIT:
+            if _commit_batch(batch, batch_dates):
+                success_count += len(batch_dates)
+            else:
+                fail_count += len(batch_dates)
+            batch = firebase_client.db.batch()
+            batch_dates = []
+
+    if batch_dates:
+        if _commit_batch(batch, batch_dates):
+            success_count += len(batch_dates)
+        else:
+            fail_count += len(batch_dates)
+
     print("\n--- Migration Complete ---")
     print(f"✅ Successful uploads: {success_count}")
     print(f"❌ Failed uploads: {fail_count}")
@@ -0,0 +1,63 @@
+import io
+import logging
+import os
+import firebase_client
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Set to "true" when the bucket grants allUsers objectViewer (uniform
+# bucket-level access). Uploads are then already public and skip make_public().
+STORAGE_BUCKET_IS_PUBLIC = os.getenv("FIREBASE_STORAGE_PUBLIC_BUCKET", "").lower() == "true"
+
+# Quality used when re-encoding uploaded images as WebP
+WEBP_QUALITY = 85
+
+# Seconds to wait for a Storage upload before giving up
+STORAGE_UPLOAD_TIMEOUT_SECONDS = 60
+
+def _to_webp(image_bytes: bytes) -> bytes:
+    """Re-encodes image bytes (e.g. PNG from Gemini) as WebP."""
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        buf = io.BytesIO()
+        img.save(buf, "WEBP", quality=WEBP_QUALITY, method=4)
+        return buf.getvalue()
+
+def upload_image_to_storage(image_bytes: bytes, filename: str) -> str:
+    """
+    Uploads image bytes to Firebase Storage as WebP and returns the public URL.
+    The filename should use the .webp extension.
+    """
+    try:
+        blob = firebase_client.bucket.blob(filename)
+        blob.upload_from_string(
+            _to_webp(image_bytes),
+            content_type='image/webp',
+            timeout=STORAGE_UPLOAD_TIMEOUT_SECONDS
+        )
+        if not STORAGE_BUCKET_IS_PUBLIC:
+            blob.make_public()
+        return blob.public_url
+
+    except Exception as e:
+        logger.error("Error uploading image to Firebase Storage: %s", e)
+        return ""
+
+def upload_image_file_to_storage(local_path: str, filename: str, content_type: str = 'image/png') -> str:
+    """
+    Streams an image file from disk to Firebase Storage as-is and returns the public URL.
+    """
+    try:
+        blob = firebase_client.bucket.blob(filename)
+        blob.upload_from_filename(
+            local_path,
+            content_type=content_type,
+            timeout=STORAGE_UPLOAD_TIMEOUT_SECONDS
+        )
+        if not STORAGE_BUCKET_IS_PUBLIC:
+            blob.make_public()
+        return blob.public_url
+
+    except Exception as e:
+        logger.error("Error uploading image file to Firebase Storage: %s", e)
+        return ""
@@ -0,0 +1,51 @@
+import os
+import unittest
+from unittest import mock
+
+# llm_utils refuses to import without an API key; no Gemini call is made here.
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+
+import db_utils
+
+
+def _fake_db(collections):
+    """A Firestore client stand-in whose collection(name) returns the given mocks."""
+    db = mock.MagicMock()
+    db.collection.side_effect = lambda name: collections[name]
+    return db
+
+
+class BackfillFromEmptyCollectionTest(unittest.TestCase):
+    def setUp(self):
+        self.aggregates = mock.MagicMock()
+        self.aggregates.document.return_value.get.return_value.exists = False
+
+    def test_used_words_backfill_with_no_challenges(self):
+        challenges = mock.MagicMock()
+        challenges.select.return_value.stream.return_value = iter([])
+        db = _fake_db({"aggregates": self.aggregates, "challenges": challenges})
+
+        with mock.patch.object(db_utils, "db", db):
+            self.assertEqual(db_utils.get_all_used_words(), set())
+
+        self.aggregates.document.assert_called_with("used_words")
+        self.aggregates.document.return_value.set.assert_called_once_with(
+            {"backfilled": True}, merge=True
+        )
+
+    def test_used_idioms_backfill_with_no_idioms(self):
+        daily_idioms = mock.MagicMock()
+        daily_idioms.stream.return_value = iter([])
+        db = _fake_db({"aggregates": self.aggregates, "daily_idioms": daily_idioms})
+
+        with mock.patch.object(db_utils, "db", db):
+            self.assertEqual(db_utils.get_all_used_idioms(), set())
+
+        self.aggregates.document.assert_called_with("used_idioms")
+        self.aggregates.document.return_value.set.assert_called_once_with(
+            {"backfilled": True}, merge=True
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()